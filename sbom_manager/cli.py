@@ -7,38 +7,98 @@ and scanning for vulnerabilities.
 """
 
 import argparse
-import logging
-import os
+import functools
 import sys
-import textwrap
-from collections import ChainMap
+import types
 from pathlib import Path
 
-from sbom_manager.config import SBOMConfig
-from sbom_manager.db import SBOMDB
-from sbom_manager.input import SBOMInput
-from sbom_manager.log import LOGGER
-from sbom_manager.output import SBOMOutput
-from sbom_manager.scan import SBOMScanner
-from sbom_manager.store import SBOMStore
 from sbom_manager.version import VERSION
 
+DESCRIPTION = """
+The SBOM Manager manages SBOMs (Software Bill of Materials) to allow
+searching for modules and scanning for vulnerabilities.
+"""
 
-def main(argv=None):
-    """Manage a set of SBOMs"""
-    argv = argv or sys.argv
+# Output headings
+MODULE_HEADINGS = (
+    "SBOM",
+    "Project",
+    "Description",
+    "Product",
+    "Version",
+    "License",
+    "Type",
+)
+MODULE_HISTORY_HEADINGS = (
+    "SBOM",
+    "SBOM Version",
+    "Project",
+    "Description",
+    "Product",
+    "Version",
+    "License",
+    "Type",
+)
+SBOM_HEADINGS = (
+    "SBOM",
+    "Project",
+    "Description",
+    "SBOM Type",
+    "Record Count",
+    "Last Updated",
+)
+SBOM_HISTORY_HEADINGS = (
+    "SBOM",
+    "SBOM Version",
+    "Project",
+    "Description",
+    "SBOM Type",
+    "Record Count",
+    "Date Added",
+)
+PROJECT_HEADINGS = ("Project", "Product", "Version", "License", "Type")
+PROJECT_HISTORY_HEADINGS = (
+    "Project",
+    "file Version",
+    "Product",
+    "Version",
+    "License",
+    "Type",
+)
+
+# SBOM types which may also be provided in JSON format
+JSON_SBOM_TYPES = frozenset({"spdx", "cyclonedx"})
+
+# Default values for options not specified on the command line
+DEFAULTS = types.MappingProxyType(
+    {
+        "add_file": "",
+        "delete_project": "",
+        "config": "",
+        "sbom_type": "",
+        "module": "",
+        "list": "",
+        "description": "",
+        "project": "",
+        "log_level": "info",
+        "format": "console",
+        "quiet": False,
+        "output_file": "console",
+        "initialise": False,
+        "scan": False,
+        "import": "",
+        "export": "",
+        "history": False,
+    }
+)
 
-    # Reset logger level to info
-    LOGGER.setLevel(logging.INFO)
 
+@functools.lru_cache(maxsize=1)
+def _build_parser():
+    """Build the command line parser (only constructed once per process)"""
     parser = argparse.ArgumentParser(
         prog="sbom-manager",
-        description=textwrap.dedent(
-            """
-            The SBOM Manager manages SBOMs (Software Bill of Materials) to allow
-            searching for modules and scanning for vulnerabilities.
-            """
-        ),
+        description=DESCRIPTION,
         epilog="\n\nPlease report issues responsibly!",
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
@@ -144,52 +204,45 @@ def main(argv=None):
     )
     parser.add_argument("-V", "--version", action="version", version=VERSION)
 
-    defaults = {
-        "add_file": "",
-        "delete_project": "",
-        "config": "",
-        "sbom_type": "",
-        "module": "",
-        "list": "",
-        "description": "",
-        "project": "",
-        "log_level": "info",
-        "format": "console",
-        "quiet": False,
-        "output_file": "console",
-        "initialise": False,
-        "scan": False,
-        "import": "",
-        "export": "",
-        "history": False,
-    }
+    return parser
+
+
+def main(argv=None):
+    """Manage a set of SBOMs"""
+    argv = argv or sys.argv
+
+    # Report version without building the argument parser
+    if argv[1:] in (["-V"], ["--version"]):
+        print(VERSION)
+        return 0
+
+    parser = _build_parser()
 
     raw_args = parser.parse_args(argv[1:])
+
+    # Only import the SBOM handlers once the arguments are known to be valid
+    import logging
+
+    from sbom_manager.config import SBOMConfig
+    from sbom_manager.db import SBOMDB
+    from sbom_manager.log import LOG_LEVELS, LOGGER, configure_logging
+
     args = {key: value for key, value in vars(raw_args).items() if value}
 
     configs = {}
 
-    args = ChainMap(args, configs, defaults)
-
-    config_file = args["config"] if args["config"] else ""
-    sbom_config = SBOMConfig(config_file)
+    # Merge command line arguments over config and default values
+    args = {**DEFAULTS, **configs, **args}
 
-    # Logging related settings
+    # Logging related settings (also resets level from any previous invocation)
+    configure_logging()
     if args["log_level"]:
-        LOGGER.setLevel(args["log_level"].upper())
+        LOGGER.setLevel(LOG_LEVELS[args["log_level"]])
 
     if args["quiet"]:
         LOGGER.setLevel(logging.CRITICAL)
 
-    # Connect to the database
-    sbom_db = SBOMDB()
-
-    # Import database if file exists
-    if args["import"] and Path(args["import"]).exists():
-        LOGGER.info(f'Import database from {args["import"]}')
-        sbom_db.copy_db(filename=args["import"], export=False)
-
-    # Add Input validation
+    # Add Input validation (before any files or the database are touched)
     if args["add_file"] and not args["description"]:
         desc = "Not specified"
     else:
@@ -199,9 +252,8 @@ def main(argv=None):
         return -1
     sbom_type = args["sbom_type"]
     # Detect json files
-    if args["add_file"].endswith(".json") and sbom_type in ["spdx", "cyclonedx"]:
+    if args["add_file"].endswith(".json") and sbom_type in JSON_SBOM_TYPES:
         sbom_type = sbom_type + "_json"
-    sbom_input = SBOMInput(sbom_type)
     if args["add_file"] and not args["project"]:
         LOGGER.info("Project name not specified")
         return -1
@@ -211,134 +263,117 @@ def main(argv=None):
         args["project"] = args["project"].replace(" ", "_")
         LOGGER.info(f"Renaming project name to {args['project']}")
 
-    # Add output handler
-    sbom_output = SBOMOutput(args["output_file"], args["format"])
-
-    # Setup store manager
-    sbom_store = SBOMStore(sbom_config.get_section("data"))
-
-    # Do something
-    if args["initialise"]:
-        # Initialise everything
-        LOGGER.debug("Initialise system")
-        sbom_db.initialise_database()
-        sbom_store.initialise_store()
-    elif args["export"] and sbom_db.check_db_exists():
-        LOGGER.info(f'Export database to {args["export"]}')
-        sbom_db.copy_db(filename=args["export"], export=True)
-    elif not sbom_db.check_db_exists():
-        LOGGER.error(
-            "Database not setup. Please enter sbom-manager --init before proceeding"
-        )
-    elif args["add_file"]:
-        # Process SBOM file
-        LOGGER.debug(f"Add SBOM {args['add_file']}")
-        sbom_data, sbom_type = sbom_input.process_file(args["add_file"])
-        if sbom_data is not None:
-            # Add entry to database
-            version = sbom_db.add_file(
-                args["add_file"], desc, args["project"], sbom_type, sbom_data
-            )
-            # And store file
-            LOGGER.debug(f"Store {args['add_file']}")
-            sbom_store.store(args["add_file"], args["project"], version=version)
-    elif args["delete_project"]:
-        # Delete SBOM
-        LOGGER.debug(f"Delete SBOM {args['delete_project']}")
-        sbom_db.delete_sbom(args['delete_project'])
-    elif args["module"]:
-        # Search for module
-        LOGGER.debug(f"Search for module {args['module']}")
-        if args["history"]:
-            sbom_output.set_headings(
-                [
-                    "SBOM",
-                    "SBOM Version",
-                    "Project",
-                    "Description",
-                    "Product",
-                    "Version",
-                    "License",
-                    "Type",
-                ]
-            )
-        else:
-            sbom_output.set_headings(
-                ["SBOM", "Project", "Description", "Product", "Version", "License", "Type"]
+    config_file = args["config"] if args["config"] else ""
+    sbom_config = SBOMConfig(config_file)
+
+    # Connect to the database
+    sbom_db = SBOMDB()
+
+    # Always close the database (writing any queued audit entries)
+    try:
+        # Import database if file exists
+        if args["import"] and Path(args["import"]).exists():
+            LOGGER.info(f'Import database from {args["import"]}')
+            sbom_db.copy_db(filename=args["import"], export=False)
+
+        # Do something
+        if args["initialise"]:
+            # Initialise everything
+            LOGGER.debug("Initialise system")
+            from sbom_manager.store import SBOMStore
+
+            sbom_store = SBOMStore(sbom_config.get_section("data"))
+            sbom_db.initialise_database()
+            sbom_store.initialise_store()
+        elif args["export"] and sbom_db.check_db_exists():
+            LOGGER.info(f'Export database to {args["export"]}')
+            sbom_db.copy_db(filename=args["export"], export=True)
+        elif not sbom_db.check_db_exists():
+            LOGGER.error(
+                "Database not setup. Please enter sbom-manager --init before proceeding"
             )
-        sbom_output.generate_output(
-            sbom_db.find_module(args["module"], args["project"], args["history"])
-        )
-    elif args["list"]:
-        # List contents of database
-        LOGGER.debug("List contents")
-        if args["list"] == "sbom":
-            if args["history"]:
-                sbom_output.set_headings(
-                    [
-                        "SBOM",
-                        "SBOM Version",
-                        "Project",
-                        "Description",
-                        "SBOM Type",
-                        "Record Count",
-                        "Date Added",
-                    ]
-                )
-            else:
-                sbom_output.set_headings(
-                    [
-                        "SBOM",
-                        "Project",
-                        "Description",
-                        "SBOM Type",
-                        "Record Count",
-                        "Last Updated",
-                    ]
+        elif args["add_file"]:
+            # Process SBOM file
+            LOGGER.debug(f"Add SBOM {args['add_file']}")
+            from sbom_manager.input import SBOMInput
+
+            sbom_input = SBOMInput(sbom_type)
+            sbom_data, sbom_type = sbom_input.process_file(args["add_file"])
+            if sbom_data is not None:
+                # Add entry to database
+                version = sbom_db.add_file(
+                    args["add_file"], desc, args["project"], sbom_type, sbom_data
                 )
-        elif args["list"] == "module":
+                # And store file
+                LOGGER.debug(f"Store {args['add_file']}")
+                from sbom_manager.store import SBOMStore
+
+                sbom_store = SBOMStore(sbom_config.get_section("data"))
+                sbom_store.store(args["add_file"], args["project"], version=version)
+        elif args["delete_project"]:
+            # Delete SBOM
+            LOGGER.debug(f"Delete SBOM {args['delete_project']}")
+            sbom_db.delete_sbom(args['delete_project'])
+        elif args["module"]:
+            # Search for module
+            LOGGER.debug(f"Search for module {args['module']}")
+            from sbom_manager.output import SBOMOutput
+
+            sbom_output = SBOMOutput(args["output_file"], args["format"])
             if args["history"]:
-                sbom_output.set_headings(
-                    ["Project", "file Version", "Product", "Version", "License", "Type"]
-                )
+                sbom_output.set_headings(MODULE_HISTORY_HEADINGS)
             else:
-                sbom_output.set_headings(["Project", "Product", "Version", "License", "Type"])
-        else:
-            if args["history"]:
-                sbom_output.set_headings(
-                    [
-                        "SBOM",
-                        "SBOM Version",
-                        "Project",
-                        "Description",
-                        "Product",
-                        "Version",
-                        "License",
-                        "Type",
-                    ]
-                )
+                sbom_output.set_headings(MODULE_HEADINGS)
+            sbom_output.generate_output(
+                sbom_db.find_module(args["module"], args["project"], args["history"])
+            )
+        elif args["list"]:
+            # List contents of database
+            LOGGER.debug("List contents")
+            from sbom_manager.output import SBOMOutput
+
+            sbom_output = SBOMOutput(args["output_file"], args["format"])
+            if args["list"] == "sbom":
+                if args["history"]:
+                    sbom_output.set_headings(SBOM_HISTORY_HEADINGS)
+                else:
+                    sbom_output.set_headings(SBOM_HEADINGS)
+            elif args["list"] == "module":
+                if args["history"]:
+                    sbom_output.set_headings(PROJECT_HISTORY_HEADINGS)
+                else:
+                    sbom_output.set_headings(PROJECT_HEADINGS)
             else:
-                sbom_output.set_headings(
-                    ["SBOM", "Project", "Description", "Product", "Version", "License", "Type"]
-                )
-        sbom_output.generate_output(
-            sbom_db.list_entries(args["list"], args["project"], args["history"])
-        )
-    elif args["scan"]:
-        # Scan for vulnerabilities
-        LOGGER.info("Scan system for vulnerabilities")
-        project_files = sbom_store.get_project(args["project"])
-        # Check that files exist for project
-        for project_file in project_files:
-            # Ensure that file used is in SPDX format
-            filename_to_scan = sbom_store.get_file(project_file, args["project"])
-            if not filename_to_scan.endswith(".spdx"):
-                # Use spdx file
-                filename_to_scan = os.path.splitext(filename_to_scan)[0] + ".spdx"
-            sbom_scan = SBOMScanner(filename_to_scan, sbom_config.get_section("scan"))
+                if args["history"]:
+                    sbom_output.set_headings(MODULE_HISTORY_HEADINGS)
+                else:
+                    sbom_output.set_headings(MODULE_HEADINGS)
+            sbom_output.generate_output(
+                sbom_db.list_entries(args["list"], args["project"], args["history"])
+            )
+        elif args["scan"]:
+            # Scan for vulnerabilities
+            LOGGER.info("Scan system for vulnerabilities")
+            from sbom_manager.scan import SBOMScanner
+            from sbom_manager.store import SBOMStore
+
+            sbom_store = SBOMStore(sbom_config.get_section("data"))
+            project_files = sbom_store.get_project(args["project"])
+            # Check that files exist for project
+            filenames_to_scan = []
+            for _, filename_to_scan in project_files:
+                # Ensure that file used is in SPDX format
+                if not filename_to_scan.endswith(".spdx"):
+                    # Use spdx file
+                    filename_to_scan = str(Path(filename_to_scan).with_suffix(".spdx"))
+                filenames_to_scan.append(filename_to_scan)
+            # Single scanner for all of the project files
+            sbom_scan = SBOMScanner(filenames_to_scan, sbom_config.get_section("scan"))
             sbom_scan.scan()
-    else:
-        LOGGER.debug("Nothing to do")
+        else:
+            LOGGER.debug("Nothing to do")
+    finally:
+        sbom_db.db_close()
     return 0
 
 
@@ -2,7 +2,6 @@
 # SPDX-License-Identifier: MIT
 
 """ Set up Config file processing """
-import configparser
 
 from sbom_manager.log import LOGGER
 
@@ -13,26 +12,26 @@ class SBOMConfig:
     """
 
     def __init__(self, filename):
-        self.config = configparser.ConfigParser()
+        self.config = None
         self.configs = filename
-        if filename != "":
+        if filename:
+            # Only load the config parser if a config file is specified
+            import configparser
+
+            self.config = configparser.ConfigParser()
             self.configs = self.config.read(filename)
         self.logger = LOGGER.getChild(self.__class__.__name__)
 
     def get_sections(self):
-        if self.configs != "":
+        if self.config is not None:
             return self.config.sections()
         return []
 
     def get_section(self, name):
-        if self.configs != "":
+        if self.config is not None:
             return self._config_section_map(name)
         return {}
 
-    # Helper function from https://wiki.python.org/moin/ConfigParserExamples
     def _config_section_map(self, section):
-        section_dict = {}
-        options = self.config.options(section)
-        for option in options:
-            section_dict[option] = self.config.get(section, option)
-        return section_dict
+        # All options in the section (no interpolation is used in config files)
+        return dict(self.config.items(section, raw=True))
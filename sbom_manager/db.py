@@ -5,19 +5,154 @@
 Management of access to database
 """
 
+import atexit
 import datetime
-import logging
 import os
 import shutil
 import sqlite3
 
 from sbom_manager.log import LOGGER
-
-logging.basicConfig(level=logging.DEBUG)
+from sbom_manager.store import default_location
 
 # database defaults
-DISK_LOCATION_DEFAULT = os.path.join(os.path.expanduser("~"), ".cache", "sbom_manager")
 DBNAME = "sbom.db"
+DATE_FORMAT = "%H:%M:%S %d-%b-%Y"
+
+# SQL statements
+INSERT_FILE = """
+    INSERT or REPLACE INTO sbom_file(
+        filename,
+        file_version,
+        project,
+        description,
+        sbom_type,
+        add_date
+    )
+    VALUES (?, ?, ?, ?, ?, ?)
+    """
+UPDATE_FILE_RECORD_COUNT = """
+    UPDATE sbom_file
+    SET record_count = ?
+    WHERE file_id = ?
+    """
+INSERT_SBOM_DATA = """
+    INSERT or REPLACE INTO sbom_data(
+        file_id,
+        vendor,
+        product,
+        version,
+        license,
+        type
+    )
+    VALUES (?, ?, ?, ?, ?, ?)
+    """
+COUNT_PROJECT_FILES = """
+    SELECT count(project) FROM sbom_file
+    WHERE project = ?
+    """
+DELETE_PROJECT_DATA = """
+    DELETE FROM sbom_data
+    WHERE file_id IN (SELECT file_id FROM sbom_file WHERE project = ?)
+    """
+DELETE_PROJECT_FILES = """
+    DELETE FROM sbom_file
+    WHERE project = ?
+    """
+# Latest version of each project, computed once rather than per row
+LATEST_VERSION = """
+    (project, file_version) IN (
+        select project, max(file_version) from sbom_file group by project
+    )
+    """
+FIND_MODULE = """
+    SELECT filename, project as P, description, product, version, license, type
+    FROM sbom_file, sbom_data
+    WHERE sbom_file.file_id = sbom_data.file_id
+    AND """ + LATEST_VERSION
+FIND_MODULE_HISTORY = """
+    SELECT filename, file_version, project, description, product, version, license, type
+    FROM sbom_file, sbom_data
+    WHERE sbom_file.file_id = sbom_data.file_id
+    """
+LIST_SBOM = """
+    SELECT filename, project as P, description, sbom_type,
+    record_count, add_date FROM sbom_file
+    """
+LIST_SBOM_HISTORY = """
+    SELECT filename, file_version, project as P, description, sbom_type,
+    record_count, add_date FROM sbom_file
+    """
+LIST_PROJECT_MODULE = """
+    SELECT project as P, product, version, license, type
+    FROM sbom_file, sbom_data
+    WHERE sbom_file.file_id = sbom_data.file_id
+    """
+LIST_PROJECT_MODULE_HISTORY = """
+    SELECT project as P, file_version, product, version, license, type
+    FROM sbom_file, sbom_data
+    WHERE sbom_file.file_id = sbom_data.file_id
+    """
+LIST_ALL = """
+    SELECT filename, project as P, description, product, version, license, type
+    FROM sbom_file, sbom_data
+    WHERE sbom_file.file_id = sbom_data.file_id
+    """
+LIST_ALL_HISTORY = """
+    SELECT filename, file_version, project as P, description, product, version, license, type
+    FROM sbom_file, sbom_data
+    WHERE sbom_file.file_id = sbom_data.file_id
+    """
+# Indexes for module searches, the file/data join and project filters.
+# (project, file_version) also answers the latest version of a project.
+# Also created when an existing database is opened so that databases from
+# earlier releases get them
+CREATE_INDEXES = """
+    CREATE INDEX IF NOT EXISTS idx_sbom_data_product ON sbom_data(product);
+    CREATE INDEX IF NOT EXISTS idx_sbom_data_file_id ON sbom_data(file_id);
+    CREATE INDEX IF NOT EXISTS idx_sbom_file_project_version
+        ON sbom_file(project, file_version);
+    """
+COUNT_INDEXED_TABLES = """
+    SELECT count(name) FROM sqlite_master
+    WHERE type = 'table' AND name IN ('sbom_file', 'sbom_data')
+    """
+INITIALISE_DATABASE = """
+    BEGIN;
+    DROP TABLE IF EXISTS sbom_file;
+    DROP TABLE IF EXISTS sbom_data;
+    DROP TABLE IF EXISTS sbom_audit;
+    CREATE TABLE sbom_file (
+        file_id INTEGER PRIMARY KEY,
+        filename TEXT NOT NULL,
+        file_version INTEGER,
+        project TEXT,
+        description TEXT,
+        sbom_type TEXT,
+        record_count TEXT,
+        add_date TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS sbom_data (
+        file_id INTEGER,
+        vendor TEXT,
+        product TEXT,
+        version TEXT,
+        license TEXT,
+        type TEXT,
+        FOREIGN KEY(file_id) REFERENCES sbom_file(file_id)
+    );
+    CREATE TABLE IF NOT EXISTS sbom_audit (
+        record_id INTEGER PRIMARY KEY,
+        audit_date TIMESTAMP,
+        command TEXT
+    );
+    """ + CREATE_INDEXES
+INSERT_AUDIT = """
+    INSERT or REPLACE INTO sbom_audit(
+        audit_date,
+        command
+    )
+    VALUES (?, ?)
+    """
 
 
 class SBOMDB:
@@ -28,258 +163,150 @@ class SBOMDB:
     def __init__(self):
 
         # set up the db path
-        self.dbpath = os.path.join(DISK_LOCATION_DEFAULT, DBNAME)
+        self.dbpath = os.path.join(default_location(), DBNAME)
         self.logger = LOGGER.getChild(self.__class__.__name__)
         LOGGER.debug(f"Database location {self.dbpath}")
         self.connection = None
+        self._audit_queue = []
+        self._flush_at_exit = False
 
     def initialise_database(self):
         """Initialize db tables used for storing sbom data"""
         self.db_open()
         cursor = self.connection.cursor()
-        # CREATE TABLE IF NOT EXISTS sbom_file (
-        file_data_create = """
-        CREATE TABLE sbom_file (
-            file_id INTEGER PRIMARY KEY,
-            filename TEXT NOT NULL,
-            file_version INTEGER,
-            project TEXT,
-            description TEXT,
-            sbom_type TEXT,
-            record_count TEXT,
-            add_date TIMESTAMP
-        )
-        """
-        sbom_data_create = """
-        CREATE TABLE IF NOT EXISTS sbom_data (
-            file_id INTEGER,
-            vendor TEXT,
-            product TEXT,
-            version TEXT,
-            license TEXT,
-            type TEXT,
-            FOREIGN KEY(file_id) REFERENCES sbom_file(file_id)
-        )
-        """
-        sbom_audit = """
-        CREATE TABLE IF NOT EXISTS sbom_audit (
-            record_id INTEGER PRIMARY KEY,
-            audit_date TIMESTAMP,
-            command TEXT
-        )
-        """
-
-        cursor.execute("DROP TABLE IF EXISTS sbom_file")
-        cursor.execute("DROP TABLE IF EXISTS sbom_data")
-        cursor.execute("DROP TABLE IF EXISTS sbom_audit")
-        cursor.execute(file_data_create)
-        cursor.execute(sbom_data_create)
-        cursor.execute(sbom_audit)
+        # Rebuild all tables as a single transaction (the script leaves the
+        # transaction open so that the audit entry is part of it)
+        cursor.executescript(INITIALISE_DATABASE)
         LOGGER.debug("Database initialised")
+        self._audit(cursor, "initialise")
         self.connection.commit()
-        self.db_close()
-        self.audit_record("initialise")
 
-    def audit_record(self, command_line):
+    def audit_record(self, command_line, audit_date=None):
         """Function that adds record to audit log"""
-        self.db_open()
-        cursor = self.connection.cursor()
-        insert_audit_record = """
-        INSERT or REPLACE INTO sbom_audit(
-            audit_date,
-            command
-        )
-        VALUES (?, ?)
-        """
-        # Insert audit entry
-        cursor.execute(
-            insert_audit_record,
-            [datetime.datetime.now().strftime("%H:%M:%S %d-%b-%Y"), command_line],
-        )
-        self.connection.commit()
-        self.db_close()
+        # Queued and written with the next update or when db_close() is called
+        # (which also happens at exit if the database is never closed)
+        if audit_date is None:
+            audit_date = datetime.datetime.now().strftime(DATE_FORMAT)
+        self._audit_queue.append((audit_date, command_line))
+        if not self._flush_at_exit:
+            atexit.register(self.db_close)
+            self._flush_at_exit = True
+
+    def _audit(self, cursor, command_line, audit_date=None):
+        # Add audit entry, and any queued entries, as part of the caller's
+        # transaction (not committed)
+        self.audit_record(command_line, audit_date)
+        self._flush_audit(cursor)
+
+    def _flush_audit(self, cursor):
+        if self._audit_queue:
+            cursor.executemany(INSERT_AUDIT, self._audit_queue)
+            self._audit_queue.clear()
 
     def add_file(self, filename, description, project, sbom_type, sbom_data):
         """Function that populates the database with SBOM file"""
         self.db_open()
         cursor = self.connection.cursor()
-
-        insert_file = """
-        INSERT or REPLACE INTO sbom_file(
-            filename,
-            file_version,
-            project,
-            description,
-            sbom_type,
-            add_date
-        )
-        VALUES (?, ?, ?, ?, ?, ?)
-        """
-        update_file_entry = """
-        UPDATE sbom_file
-        SET record_count = ?
-        WHERE file_id = ?
-        """
-        insert_sbom = """
-        INSERT or REPLACE INTO sbom_data(
-            file_id,
-            vendor,
-            product,
-            version,
-            license,
-            type
-        )
-        VALUES (?, ?, ?, ?, ?, ?)
-        """
-        find_project = """
-        SELECT count(project) FROM sbom_file
-        WHERE project = ?
-        """
-        # Find project
-        cursor.execute(find_project, [project])
-        file_version = cursor.fetchone()
-        # Insert file entry
-        cursor.execute(
-            insert_file,
-            [
-                os.path.basename(filename),
-                file_version[0] + 1,
-                project,
-                description,
-                sbom_type,
-                datetime.datetime.now().strftime("%H:%M:%S %d-%b-%Y"),
-            ],
-        )
-        # Find id of last entry to reference with SBOM data
-        file_id = cursor.lastrowid
-        # Insert SBOM data records. Maintain count of records inserted
-        record_count = 0
-        for data in sbom_data:
-            license = data["license"]
-            if license == "":
-                license = "NOASSERTION"
-            type = data["type"]
-            # Make sure all entries are lowercase
+        # Timestamp shared by the file entry and its audit entry
+        add_date = datetime.datetime.now().strftime(DATE_FORMAT)
+        # Add file entry and all of its records as a single transaction which is
+        # rolled back if any record fails
+        with self.connection:
+            # Take the write lock before reading the version count so that
+            # concurrent adds to a project cannot allocate the same version
+            cursor.execute("BEGIN IMMEDIATE")
+            # Find project
+            cursor.execute(COUNT_PROJECT_FILES, [project])
+            file_version = cursor.fetchone()
+            # Insert file entry
             cursor.execute(
-                insert_sbom,
+                INSERT_FILE,
                 [
+                    os.path.basename(filename),
+                    file_version[0] + 1,
+                    project,
+                    description,
+                    sbom_type,
+                    add_date,
+                ],
+            )
+            # Find id of last entry to reference with SBOM data
+            file_id = cursor.lastrowid
+            # Insert SBOM data records as a single batch, consuming sbom_data lazily
+            # so that it can be any iterable. Make sure all entries are lowercase
+            sbom_records = (
+                (
                     file_id,
                     data["vendor"].lower(),
                     data["product"].lower(),
                     data["version"].lower(),
-                    license,
-                    type,
-                ],
+                    data["license"] if data["license"] != "" else "NOASSERTION",
+                    data["type"],
+                )
+                for data in sbom_data
             )
-            record_count = record_count + 1
-        update_params = [record_count, file_id]
-        cursor.execute(update_file_entry, update_params)
-        self.connection.commit()
-        self.db_close()
-        self.audit_record("add")
+            cursor.executemany(INSERT_SBOM_DATA, sbom_records)
+            # Total number of records inserted by the batch
+            record_count = cursor.rowcount
+            update_params = [record_count, file_id]
+            cursor.execute(UPDATE_FILE_RECORD_COUNT, update_params)
+            self._audit(cursor, "add", add_date)
         return file_version[0] + 1
 
     def delete_sbom(self, sbom):
         """Function that removes a sbom from the database"""
         self.db_open()
         cursor = self.connection.cursor()
-        # Find project id - there maybe multiple files associated with a single project
-        find_project = f"SELECT file_id from sbom_file where project='{sbom}'"
-        project_id = cursor.execute(find_project).fetchone()[0]
-        # Get project_id from database response
-        #project_id = 1
-        # Delete files associated with project
-        # For each project_id
-        delete_sbom_files = f"DELETE from sbom_data WHERE file_id='{project_id}'"
-        cursor.execute(delete_sbom_files)
-        delete_sbom = f"DELETE from sbom_file WHERE project='{sbom}'"
-        LOGGER.debug(f"Query: {delete_sbom}")
-        cursor.execute(delete_sbom)
+        # Delete data for all of the files associated with the project (there
+        # maybe multiple files associated with a single project)
+        cursor.execute(DELETE_PROJECT_DATA, [sbom])
+        LOGGER.debug(f"Query: {DELETE_PROJECT_FILES} [{sbom}]")
+        cursor.execute(DELETE_PROJECT_FILES, [sbom])
+        self._audit(cursor, "delete")
         self.connection.commit()
-        self.db_close()
-        self.audit_record("delete")
 
     def find_module(self, module, project, history=False):
         """Function that searches for module in database"""
         self.db_open()
         cursor = self.connection.cursor()
-        find_module = """
-        SELECT filename, project as P, description, product, version, license, type
-        FROM sbom_file, sbom_data
-        WHERE sbom_file.file_id = sbom_data.file_id
-        AND file_version = (select max(file_version) from sbom_file where project = P)
-        AND product LIKE ?
-        """
-        find_module_history = """
-        SELECT filename, file_version, project, description, product, version, license, type
-        FROM sbom_file, sbom_data
-        WHERE sbom_file.file_id = sbom_data.file_id AND product LIKE ?
-        """
-        find_module_query = find_module_history if history else find_module
         order_query = " ORDER BY product ASC, project ASC, file_version DESC"
+        # Build the filter as a list of conditions with matching parameters
+        conditions = ["product LIKE ?"]
         query_params = ["%" + module + "%"]
         # Handle optional project parameter
         if project != "":
+            conditions.append("project = ?")
             query_params.append(project)
-            find_module_query = find_module_query + " AND project = ?"
+        find_module_query = (
+            (FIND_MODULE_HISTORY if history else FIND_MODULE)
+            + " AND "
+            + " AND ".join(conditions)
+        )
         LOGGER.debug(f"Query: {find_module_query}{order_query} {query_params}")
-        cursor.execute(find_module_query + order_query, query_params)
-        results = cursor.fetchall()
-        self.db_close()
         self.audit_record("find")
-        return results
+        # Results are streamed from the cursor rather than fetched as a list
+        return cursor.execute(find_module_query + order_query, query_params)
 
     def list_entries(self, contents, project, history=False, version=None):
         """Function that extracts entries from database"""
         self.db_open()
         cursor = self.connection.cursor()
-        list_sbom = """
-        SELECT filename, project as P, description, sbom_type,
-        record_count, add_date FROM sbom_file
-        """
-        list_sbom_history = """
-        SELECT filename, file_version, project as P, description, sbom_type,
-        record_count, add_date FROM sbom_file
-        """
-        list_project_module = """
-        SELECT project as P, product, version, license, type
-        FROM sbom_file, sbom_data
-        WHERE sbom_file.file_id = sbom_data.file_id
-        """
-        list_project_module_history = """
-        SELECT project as P, file_version, product, version, license, type
-        FROM sbom_file, sbom_data
-        WHERE sbom_file.file_id = sbom_data.file_id
-        """
-        list_all = """
-        SELECT filename, project as P, description, product, version, license, type
-        FROM sbom_file, sbom_data
-        WHERE sbom_file.file_id = sbom_data.file_id
-        """
-        list_all_history = """
-        SELECT filename, file_version, project as P, description, product, version, license, type
-        FROM sbom_file, sbom_data
-        WHERE sbom_file.file_id = sbom_data.file_id
-        """
-        latest_all = """
-        file_version = (select max(file_version) from sbom_file where project = P)
-        """
         if contents == "sbom":
-            list_query = list_sbom_history if history else list_sbom
+            list_query = LIST_SBOM_HISTORY if history else LIST_SBOM
             list_query_prefix = " WHERE"
             order_query = " ORDER BY project ASC, file_version DESC"
         elif contents == "module":
-            list_query = list_project_module_history if history else list_project_module
+            list_query = LIST_PROJECT_MODULE_HISTORY if history else LIST_PROJECT_MODULE
             list_query_prefix = " AND "
             order_query = " ORDER BY product ASC, project ASC, file_version DESC"
         else:
-            list_query = list_all_history if history else list_all
+            list_query = LIST_ALL_HISTORY if history else LIST_ALL
             list_query_prefix = " AND"
             order_query = " ORDER BY project ASC, file_version DESC"
         query_params = []
         # Handle history parameter
         if not history and version is None:
-            list_query = list_query + list_query_prefix + latest_all
+            list_query = list_query + list_query_prefix + LATEST_VERSION
             list_query_prefix = " AND"
         # Handle optional project parameter
         if project != "":
@@ -289,38 +316,60 @@ class SBOMDB:
             query_params.append(version)
             list_query = list_query + list_query_prefix + " file_version = ?"
         LOGGER.debug(f"Query: {list_query}{order_query} {query_params}")
-        cursor.execute(list_query + order_query, query_params)
-        results = cursor.fetchall()
-        self.db_close()
         self.audit_record("list")
-        return results
+        # Results are streamed from the cursor rather than fetched as a list
+        return cursor.execute(list_query + order_query, query_params)
 
     def check_db_exists(self):
         return os.path.isfile(self.dbpath) and (os.path.getsize(self.dbpath) > 100)
 
-    def db_open(self):
-        """Opens connection to sqlite database."""
-        if not os.path.exists(DISK_LOCATION_DEFAULT):
-            os.makedirs(DISK_LOCATION_DEFAULT)
+    def _has_tables(self):
+        # Database may be new, or not (yet) initialised
+        cursor = self.connection.execute(COUNT_INDEXED_TABLES)
+        return cursor.fetchone()[0] == 2
 
+    def db_open(self):
+        """Opens connection to sqlite database (reused until db_close is called)."""
         if not self.connection:
+            # Only check the database directory when a connection is needed
+            os.makedirs(default_location(), exist_ok=True)
             self.connection = sqlite3.connect(self.dbpath)
+            # Write ahead log with relaxed syncing avoids an fsync per transaction
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            # Keep temporary tables and indices in memory and allow a larger
+            # page cache (64 MiB) for joins over large SBOM collections
+            self.connection.execute("PRAGMA temp_store=MEMORY")
+            self.connection.execute("PRAGMA cache_size=-65536")
+            # Read pages through a memory map (up to 256 MiB) rather than read()
+            self.connection.execute("PRAGMA mmap_size=268435456")
+            if self._has_tables():
+                # Add any indexes missing from an older database
+                self.connection.executescript(CREATE_INDEXES)
             LOGGER.debug("Database opened")
 
     def db_close(self):
         """Closes connection to sqlite database."""
+        if self._audit_queue:
+            # Write any outstanding audit entries before closing
+            self.db_open()
+            with self.connection:
+                self._flush_audit(self.connection.cursor())
         if self.connection:
             self.connection.close()
             self.connection = None
             LOGGER.debug("Database closed")
 
     def copy_db(self, filename, export=True):
-        self.db_close()
         if export:
             self.audit_record("Export database")
+            # Closing the connection writes all changes to the database file
+            self.db_close()
             LOGGER.debug(f"Database export to {filename}")
             shutil.copy(self.dbpath, filename)
         else:
             self.audit_record("Import database")
+            # Connection must be closed before the database file is replaced
+            self.db_close()
             LOGGER.debug(f"Database import from {filename}")
             shutil.copy(filename, self.dbpath)
@@ -3,16 +3,33 @@
 
 """ Set up SBOM Input processing """
 
-import json
+import csv
 import os.path
 import re
 
 import defusedxml.ElementTree as ET
+import ijson
 from lib4sbom.parser import SBOMParser
 from lib4sbom.data.document import SBOMDocument
 
 from sbom_manager.log import LOGGER
 
+# Read SBOM files in large blocks to reduce the number of read calls
+READ_BUFFER_SIZE = 1 << 20
+# Prefixes of the SPDX tags which describe a package
+SPDX_PACKAGE_TAGS = ("Package", "PrimaryPackagePurpose")
+# SPDX package tags and the module field they set
+SPDX_PACKAGE_FIELDS = {
+    "PackageName": "product",
+    "PackageVersion": "version",
+    "PackageLicenseConcluded": "license",
+    "PrimaryPackagePurpose": "type",
+}
+# CycloneDX component types which are recorded
+CYCLONEDX_COMPONENT_TYPES = frozenset({"library", "application", "operating-system"})
+# Version within a directory filename (PRODUCT-VERSION[-Other]?)
+VERSION_PATTERN = re.compile(r"-\d[.\d]*[a-z0-9]*")
+
 
 class SBOMInput:
     """
@@ -63,108 +80,99 @@ class SBOMInput:
                     "type": type,
                 }
             )
-            LOGGER.debug(f"Add {product} {version}")
+            LOGGER.debug("Add %s %s", product, version)
         return modules, sbom_type
 
     def process_spdx_file(self, filename):
         # Process SPDX Tag file
         modules = []
-        with open(filename) as spdx_file:
-            lines = spdx_file.readlines()
-        product = ""
-        vendor = ""
-        license = ""
-        version = ""
-        type = ""
-        for line in lines:
-            line_elements = line.split(":")
-            if line_elements[0] == "PackageName":
-                if product != "" and version != "":
-                    modules.append(
-                        {
-                            "vendor": vendor,
-                            "product": product,
-                            "version": version,
-                            "license": license,
-                            "type": type,
-                        }
-                    )
-                    LOGGER.debug(f"Add {product} {version}")
-                product = line_elements[1].strip().rstrip("\n")
-                version = ""
-                license = ""
-                type = ""
-            elif line_elements[0] == "PackageVersion":
-                version = line_elements[1].strip().rstrip("\n")
-                version = version.split("-")[0]
-                version = version.split("+")[0]
-            elif line_elements[0] == "PackageLicenseConcluded":
-                license = line_elements[1].strip().rstrip("\n")
-            elif line_elements[0] == "PrimaryPackagePurpose":
-                type = line_elements[1].strip().rstrip("\n")
-        if product != "" and version != "":
-            modules.append(
-                {
-                    "vendor": vendor,
-                    "product": product,
-                    "version": version,
-                    "license": license,
-                    "type": type,
-                }
-            )
-            LOGGER.debug(f"Add {product} {version}")
+        package = {}
+        with open(filename, buffering=READ_BUFFER_SIZE) as spdx_file:
+            for line in spdx_file:
+                # Only package tags are of interest
+                if not line.startswith(SPDX_PACKAGE_TAGS):
+                    continue
+                tag, _, value = line.partition(":")
+                field = SPDX_PACKAGE_FIELDS.get(tag)
+                if field is None:
+                    continue
+                value = value.strip()
+                if field == "product":
+                    # Start of new package
+                    self._add_spdx_package(modules, package)
+                    package = {
+                        "vendor": "",
+                        "product": value,
+                        "version": "",
+                        "license": "",
+                        "type": "",
+                    }
+                elif field == "version":
+                    package["version"] = value.split("-")[0].split("+")[0]
+                else:
+                    package[field] = value
+        self._add_spdx_package(modules, package)
         return modules, "spdx"
 
+    def _add_spdx_package(self, modules, package):
+        # Only add packages with both a name and a version
+        if package.get("product", "") != "" and package.get("version", "") != "":
+            modules.append(package)
+            LOGGER.debug("Add %s %s", package["product"], package["version"])
+
     def process_spdx_json_file(self, filename):
         # Process SPDX JSON file
         modules = []
-        data = json.load(open(filename))
-        for d in data["packages"]:
-            product = d["name"]
-            version = d["versionInfo"]
-            vendor = ""
-            type = d.get("primaryPackagePurpose", "")
-            license = d.get("licenseConcluded", "")
-            modules.append(
-                {
-                    "vendor": vendor,
-                    "product": product,
-                    "version": version,
-                    "license": license,
-                    "type": type,
-                }
-            )
-            LOGGER.debug(f"Add {product} {version}")
+        # Stream the packages rather than loading the whole document
+        with open(filename, "rb", buffering=READ_BUFFER_SIZE) as json_file:
+            for d in ijson.items(json_file, "packages.item"):
+                product = d["name"]
+                version = d["versionInfo"]
+                vendor = ""
+                type = d.get("primaryPackagePurpose", "")
+                license = d.get("licenseConcluded", "")
+                modules.append(
+                    {
+                        "vendor": vendor,
+                        "product": product,
+                        "version": version,
+                        "license": license,
+                        "type": type,
+                    }
+                )
+                LOGGER.debug("Add %s %s", product, version)
         return modules, "spdx"
 
     def process_cyclonedx_file(self, filename):
         # Process CycloneDX XML BOM file
         modules = []
-        tree = ET.parse(filename)
-        # Find root element
-        root = tree.getroot()
-        # Extract schema
-        schema = root.tag[: root.tag.find("}") + 1]
         vendor = ""
-        for components in root.findall(schema + "components"):
-            for component in components.findall(schema + "component"):
-                # Only application, library and operating-systems components
-                if component.attrib["type"] in [
-                    "library",
-                    "application",
-                    "operating-system",
-                ]:
-                    type = component.attrib["type"]
-                    component_name = component.find(schema + "name")
-                    product = component_name.text
-                    component_version = component.find(schema + "version")
-                    version = component_version.text
-                    license = ""
-                    component_license = component.find(schema + "licenses")
-                    if component_license is not None:
-                        license_data = component_license.find(schema + "expression")
-                        if license_data is not None:
-                            license = license_data.text
+        schema = ""
+        # Tags of the elements enclosing the current element
+        path = []
+        # Stream the file, discarding each top level component once processed
+        with open(filename, "rb", buffering=READ_BUFFER_SIZE) as xml_file:
+            for event, element in ET.iterparse(xml_file, events=("start", "end")):
+                if event == "start":
+                    if not path:
+                        # Extract schema from root element
+                        schema = element.tag[: element.tag.find("}") + 1]
+                    path.append(element.tag)
+                    continue
+                path.pop()
+                # Only components within the top level components element
+                if len(path) != 2 or path[1] != schema + "components":
+                    continue
+                if element.tag != schema + "component":
+                    continue
+                # Only application, library and operating-system components
+                type = element.attrib.get("type")
+                if type in CYCLONEDX_COMPONENT_TYPES:
+                    product = element.findtext(schema + "name")
+                    version = element.findtext(schema + "version")
+                    license = element.findtext(
+                        f"{schema}licenses/{schema}expression", default=""
+                    )
                     if product is not None and version is not None:
                         modules.append(
                             {
@@ -175,105 +183,101 @@ class SBOMInput:
                                 "type": type,
                             }
                         )
-                        LOGGER.debug(f"Add {product} {version}")
+                        LOGGER.debug("Add %s %s", product, version)
+                element.clear()
         return modules, "cyclonedx"
 
     def process_cyclonedx_json_file(self, filename):
         # Process CycloneDX JSON file
         modules = []
-        data = json.load(open(filename))
-        for d in data["components"]:
-            if d["type"] in ["application", "library"]:
-                product = d["name"]
-                version = d["version"] if "version" in d else ""
-                license = ""
-                vendor = ""
-                license_data = None
-                type = d.get("type", "")
-                # Multiple ways of defining license data
-                if "licenses" in d and len(d["licenses"]) > 0:
-                    license_data = d["licenses"][0]
-                elif "evidence" in d and len(d["evidence"]["licenses"]) > 0:
-                    license_data = d["evidence"]["licenses"][0]
-                if license_data is not None:
-                    license = None
-                    if "license" in license_data:
-                        if "id" in license_data["license"]:
-                            license = license_data["license"]["id"]
-                        elif "name" in license_data["license"]:
-                            license = license_data["license"]["name"]
-                        elif "expression" in license_data["license"]:
-                            license = license_data["license"]["expression"]
-                    elif "expression" in license_data:
-                        license = license_data["expression"]
-                    if license is None:
-                        license = "UNKNOWN"
-                modules.append(
-                    {
-                        "vendor": vendor,
-                        "product": product,
-                        "version": version,
-                        "license": license,
-                        "type": type,
-                    }
-                )
-                LOGGER.debug(f"Add {product} {version}")
+        # Stream the components rather than loading the whole document
+        with open(filename, "rb", buffering=READ_BUFFER_SIZE) as json_file:
+            for d in ijson.items(json_file, "components.item"):
+                if d["type"] in ["application", "library"]:
+                    product = d["name"]
+                    version = d["version"] if "version" in d else ""
+                    vendor = ""
+                    type = d.get("type", "")
+                    # Multiple ways of defining license data
+                    evidence = d.get("evidence", {})
+                    license_data = d.get("licenses") or evidence.get("licenses")
+                    if license_data:
+                        license_info = license_data[0].get("license") or {}
+                        license = (
+                            license_info.get("id")
+                            or license_info.get("name")
+                            or license_info.get("expression")
+                            or license_data[0].get("expression")
+                            or "UNKNOWN"
+                        )
+                    else:
+                        license = ""
+                    modules.append(
+                        {
+                            "vendor": vendor,
+                            "product": product,
+                            "version": version,
+                            "license": license,
+                            "type": type,
+                        }
+                    )
+                    LOGGER.debug("Add %s %s", product, version)
         return modules, "cyclonedx"
 
     def process_csv_file(self, filename):
         # Process CSV file
         modules = []
-        with open(filename) as csv_file:
-            lines = csv_file.readlines()
-        for line in lines:
-            # Ignore comment line indicated by #
-            if line[0] != "#":
-                line_elements = line.strip().rstrip("\n").split(",")
-                # Ignore blank lines
-                if len(line_elements) == 3:
+        with open(filename, newline="", buffering=READ_BUFFER_SIZE) as csv_file:
+            for line_elements in csv.reader(csv_file):
+                # Ignore blank lines and comment lines indicated by #
+                if len(line_elements) == 3 and line_elements[0][:1] != "#":
+                    product = line_elements[1].strip()
+                    version = line_elements[2].strip()
                     modules.append(
                         {
                             "vendor": line_elements[0].strip(),
-                            "product": line_elements[1].strip(),
-                            "version": line_elements[2].strip(),
+                            "product": product,
+                            "version": version,
                             "license": "",
                             "type": "",
                         }
                     )
-                    LOGGER.debug(
-                        f"Add {line_elements[1].strip()} {line_elements[2].strip()}"
-                    )
+                    LOGGER.debug("Add %s %s", product, version)
         return modules, "csv"
 
     def process_directory_file(self, filename):
         # Process directory file
         modules = []
-        with open(filename) as dir_file:
-            lines = dir_file.readlines()
-        for line in lines:
-            # Ignore comment line indicated by #
-            if line[0] != "#":
+        # (product, version) of modules already added
+        seen = set()
+        with open(filename, buffering=READ_BUFFER_SIZE) as dir_file:
+            for line in dir_file:
+                # Ignore comment line indicated by #
+                if line[0] == "#":
+                    continue
                 line_element = line.strip().rstrip("\n")
                 # Extract the filename (without extension) - make lowercase
                 item = os.path.splitext(os.path.basename(line_element))[0].lower()
                 # Parse line PRODUCT-VERSION[-Other]?. If pattern not followed ignore...
                 # Version assumed to start with digit. Therefore find first digit
-                product_version = re.search(r"-\d[.\d]*[a-z0-9]*", item)
+                product_version = VERSION_PATTERN.search(item)
                 if product_version is not None:
                     # Extract version from item (don't store initial '-' separator)
                     version = product_version.group(0)[1:]
                     # Extract product from item
                     product = item[: product_version.start()]
-                    if product != "" and version != "":
-                        new_module = {
-                            "vendor": "",
-                            "product": product.strip(),
-                            "version": version.strip(),
-                            "license": "",
-                            "type": "",
-                        }
-                        # Ensure that entry not duplicated
-                        if new_module not in modules:
-                            modules.append(new_module)
-                            LOGGER.debug(f"Add {product} {version}")
+                    module_key = (product.strip(), version.strip())
+                    # Ensure that entry not duplicated
+                    if product != "" and version != "" and module_key not in seen:
+                        seen.add(module_key)
+                        modules.append(
+                            {
+                                "vendor": "",
+                                "product": module_key[0],
+                                "version": module_key[1],
+                                "license": "",
+                                "type": "",
+                            }
+                        )
+                        LOGGER.debug("Add %s %s", product, version)
         return modules, "csv"
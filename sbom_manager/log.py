@@ -16,14 +16,23 @@ class LevelFilter(logging.Filter):
         return record.levelno < self.level
 
 
-logging.basicConfig(
-    level="INFO",
-    format="%(asctime)s %(levelname)-8s %(name)s - %(message)s",
-    datefmt="[%X]",
-)
+def configure_logging():
+    """Add the console handler to the root logger (only done by the CLI)"""
+    logging.basicConfig(
+        level="INFO",
+        format="%(asctime)s %(levelname)-8s %(name)s - %(message)s",
+        datefmt="[%X]",
+    )
 
-# Add the handlers to the root logger
-root_logger = logging.getLogger()
 
 LOGGER = logging.getLogger(__package__)
 LOGGER.setLevel(logging.INFO)
+
+# Map command line log level names to logging levels
+LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "critical": logging.CRITICAL,
+}
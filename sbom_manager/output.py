@@ -3,8 +3,14 @@
 
 """ Set up Output Formatting """
 
+import itertools
+import sys
+
 from sbom_manager.log import LOGGER
 
+# Buffer output files so that rows are written in large blocks
+WRITE_BUFFER_SIZE = 1 << 20
+
 
 class OutputManager:
     """Helper class for managing output to file and console."""
@@ -13,7 +19,7 @@ class OutputManager:
         self.out_type = out_type
         self.filename = filename
         if self.out_type == "file":
-            self.file_handle = open(filename, "w")
+            self.file_handle = open(filename, "w", buffering=WRITE_BUFFER_SIZE)
         else:
             self.file_handle = None
 
@@ -33,6 +39,11 @@ class OutputManager:
         else:
             self.console_out(message)
 
+    def show_lines(self, messages):
+        # Write all messages with a single call rather than one write per message
+        handle = self.file_handle if self.out_type == "file" else sys.stdout
+        handle.writelines(f"{message}\n" for message in messages)
+
 
 class SBOMOutput:
     """Output manager for SBOM data."""
@@ -60,45 +71,42 @@ class SBOMOutput:
 
     def format_element(self, element):
         # If element larger than maximum width, curtail element and add '...'
-        if len(str(element)) > self.WIDTH:
-            return str(element)[: self.WIDTH - 3] + "..."
+        element = str(element)
+        if len(element) > self.WIDTH:
+            return element[: self.WIDTH - 3] + "..."
         return element
 
     def format_data(self, data):
         # Return formatted line
-        formatted_data = ""
-        for entry in data:
-            if entry is not None:
-                formatted_data = (
-                    formatted_data
-                    + f"{self.format_element(entry) :{self.PADDING}<{self.WIDTH}}"
-                    + " "
-                )
-            else:
-                space = " "
-                formatted_data = formatted_data + f"{space :{self.PADDING}<{self.WIDTH}}" + " "
-        return formatted_data
+        return "".join(
+            f"{self.format_element(entry) :{self.PADDING}<{self.WIDTH}} "
+            if entry is not None
+            else f"{' ' :{self.PADDING}<{self.WIDTH}} "
+            for entry in data
+        )
 
     def format_csv_data(self, data):
         # Return csv formatted line
-        formatted_data = ""
-        for entry in data:
-            formatted_data = formatted_data + entry + ","
-        # Don't return last character (extra ,)
-        return formatted_data[:-1]
+        return ",".join("" if entry is None else str(entry) for entry in data)
 
     def send_output(self, data):
         self.output_manager.show(data)
 
     def generate_output(self, dataset):
-        if len(dataset) > 0:
+        # Dataset may be any iterable (e.g. a database cursor)
+        dataset = iter(dataset)
+        first_item = next(dataset, None)
+        if first_item is not None:
+            # Select the formatter once rather than for every row
+            formatter = self.format_process[self.output_format]
             if self.headings is not None:
-                hdr = self.format_process[self.output_format](self.headings)
+                hdr = formatter(self.headings)
                 self.send_output(hdr)
                 if self.output_format == "console":
                     self.send_output("=" * len(hdr))
-            for data_item in dataset:
-                self.send_output(self.format_process[self.output_format](data_item))
+            self.output_manager.show_lines(
+                map(formatter, itertools.chain([first_item], dataset))
+            )
         else:
             self.send_output("No data found")
         self.output_manager.close()
@@ -3,6 +3,8 @@
 
 """ SBOM Vulnerability Scanner """
 
+import os
+import shlex
 import subprocess
 
 from sbom_manager.log import LOGGER
@@ -13,30 +15,34 @@ class SBOMScanner:
     Simple SBOM Vulnerability Scanner.
     """
 
-    def __init__(self, filename, options):
+    def __init__(self, filenames, options):
         self.logger = LOGGER.getChild(self.__class__.__name__)
-        self.filename = filename
+        # Accept either a single file or a list of files to scan
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        self.filenames = filenames
         self.options = options
 
-    def run_program(self, command_line):
-        # Remove any null bytes
-        command_line = command_line.replace("\x00", "")
-        # print (command_line)
-        # Split command line into individual elements
-        params = command_line.split()
-        # print(params)
-        res = subprocess.run(params, capture_output=True, text=True)
-        # print(res)
-        return res.stdout.splitlines()
+    def run_program(self, params):
+        # Stream output lines as the scanner produces them (errors are ignored)
+        with subprocess.Popen(
+            params, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        ) as process:
+            for line in process.stdout:
+                yield line.rstrip("\n")
 
     def scan(self):
-        LOGGER.info(f"Scan {self.filename} for vulnerabilities")
         if len(self.options) > 0 and "application" in self.options:
-            command_line = f"{self.options['application']} {self.options['options']} "
-            command_line = command_line + f"{self.filename}"
-            LOGGER.info(command_line)
-            scan_output = self.run_program(command_line)
-            for i in scan_output:
-                print(i)
+            scan_command = f"{self.options['application']} {self.options['options']}"
+            # Split command once, honouring quoted arguments. Backslashes are
+            # path separators on Windows so are not treated as escapes there
+            scan_params = shlex.split(scan_command, posix=(os.name != "nt"))
+            for filename in self.filenames:
+                LOGGER.info(f"Scan {filename} for vulnerabilities")
+                LOGGER.info(f"{scan_command} {filename}")
+                # Filename passed as a single argument (may contain spaces)
+                scan_output = self.run_program(scan_params + [filename])
+                for i in scan_output:
+                    print(i)
         else:
             LOGGER.warning("Unable to scan - vulnerability scanner not configured")
@@ -3,14 +3,19 @@
 
 """ Set up File Storage """
 
+import functools
 import os
 import os.path
 import shutil
 
 from sbom_manager.log import LOGGER
 
+
 # File store defaults
-DISK_LOCATION_DEFAULT = os.path.join(os.path.expanduser("~"), ".cache", "sbom_manager")
+@functools.lru_cache(maxsize=1)
+def default_location():
+    """Default location, resolved on first use rather than at import"""
+    return os.path.join(os.path.expanduser("~"), ".cache", "sbom_manager")
 
 
 class SBOMStore:
@@ -20,7 +25,7 @@ class SBOMStore:
 
     def __init__(self, disk_location):
         self.logger = LOGGER.getChild(self.__class__.__name__)
-        self.location = DISK_LOCATION_DEFAULT
+        self.location = default_location()
         if len(disk_location) > 0:
             # User specified storage location
             self.location = disk_location["location"]
@@ -32,44 +37,42 @@ class SBOMStore:
         if not os.path.isdir(project_location):
             LOGGER.debug(f"Creating file store for {project}")
             os.mkdir(project_location)
-        LOGGER.debug(f"Copying {filename} to store")
         dest_file = f"{version}_{os.path.basename(filename)}"
         destination = os.path.join(project_location, dest_file)
-        shutil.copy(filename, destination)
-        if delete:
+        # Only the file contents are needed (not the permission bits)
+        if not delete:
+            LOGGER.debug(f"Copying {filename} to store")
+            shutil.copyfile(filename, destination)
+            return
+        LOGGER.debug(f"Moving {filename} to store")
+        try:
+            # Just a rename if the store is on the same filesystem
+            os.replace(filename, destination)
+        except OSError:
+            shutil.copyfile(filename, destination)
             LOGGER.debug(f"Deleting {filename}")
             os.remove(filename)
 
-    def get_file(self, filename, project):
-        project_location = os.path.join(self.location, project)
-        file_location = os.path.join(project_location, filename)
-        if not os.path.exists(file_location):
-            LOGGER.debug(f"File {filename} not found for {project}")
-            return None
-        return file_location
-
     def get_project(self, project):
-        # Check project store exists
+        # Returns (filename, path) for each file in the project store
         project_location = os.path.join(self.location, project)
         if not os.path.isdir(project_location):
             LOGGER.debug(f"No files for {project}")
             return []
-        project_list = []
-        # Get list of files (most recent first). Must be in directory for sort to work.
-        os.chdir(project_location)
-        for file_path in sorted(os.listdir("."), key=os.path.getmtime, reverse=True):
-            LOGGER.debug(f"Processing file {file_path}")
-            # Ignore . files
-            if not file_path.startswith("."):
-                project_list.append(file_path)
+        # Get list of files (most recent first). Ignore . files
+        with os.scandir(project_location) as entries:
+            project_files = [
+                entry for entry in entries if not entry.name.startswith(".")
+            ]
+        project_files.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
         # Return list of files
-        return project_list
+        return [(entry.name, entry.path) for entry in project_files]
 
     def initialise_store(self):
-        for file_path in os.listdir(self.location):
-            full_path = os.path.join(self.location, file_path)
-            LOGGER.debug(f"Processing file {file_path} - {os.path.isdir(full_path)}")
-            # Ignore . files
-            if not file_path.startswith(".") and os.path.isdir(full_path):
-                LOGGER.debug(f"Deleting project directory {file_path}")
-                shutil.rmtree(full_path)
+        with os.scandir(self.location) as entries:
+            for entry in entries:
+                LOGGER.debug(f"Processing file {entry.name} - {entry.is_dir()}")
+                # Ignore . files
+                if not entry.name.startswith(".") and entry.is_dir():
+                    LOGGER.debug(f"Deleting project directory {entry.name}")
+                    shutil.rmtree(entry.path)